@@ -1,8 +1,7 @@
 import numpy as np 
-import matplotlib.pyplot as plt 
-from astropy.io import fits
 
 from . import disk_model as DM
+from . import results as R
 
 
 class FitCube():
@@ -32,4 +31,13 @@ class FitCube():
 
         self.model_vfield=DM.get_disk_model(self.starting_disk_parameters)
 
-        
\ No newline at end of file
+
+    def open_results(self, directory, **kwargs):
+
+        """
+        Start streaming sampler output to directory. kwargs are passed to results.ResultsWriter
+        """
+
+        self.results_writer=R.ResultsWriter(directory, **kwargs)
+
+        return self.results_writer
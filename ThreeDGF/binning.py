@@ -17,21 +17,31 @@ def bin_cube(X, Y, bins, modelcube):
         array: a 2D array of shape (n_lamdas, n_unique_bins) of spectra
     """
 
-    assert len(x)==len(y)==len(bins), 'The lists X, Y and bins must be the same length!'
+    assert len(X)==len(Y)==len(bins), 'The lists X, Y and bins must be the same length!'
 
     n_lamdas, ny, nx=modelcube.shape
     assert (n_lamdas>nx) & (n_lamdas>ny), 'The wavelength axis must be first. Change this if you have a very large cube, where n_lamdas<nx or ny!'
     
     assert len(bins)==ny*nx, 'We must have the same number of bins as pixels in the datacube'
 
-    spectra=np.empty(n_lamdas, len(np.unique(bins)))
+    return _sum_bins(X, Y, bins, modelcube)
 
-    for i, b in enumerate(np.unique(bins)):
+
+def _sum_bins(X, Y, bins, modelcube):
+
+    """
+    Sum the spectra in each bin, without any checks on the shape of modelcube. 
+    This means it can be used on a slice of the wavelength axis, where n_lamdas may be smaller than nx or ny.
+    """
+
+    unique_bins=np.unique(bins)
+    spectra=np.empty((modelcube.shape[0], len(unique_bins)))
+
+    for i, b in enumerate(unique_bins):
 
         bin_mask=bins==b
-        spec=modelcube[:, Y[bin_mask], X[bin_mask]].sum(axis=1).sum(axis=1)
+        spec=modelcube[:, Y[bin_mask], X[bin_mask]].sum(axis=1)
 
         spectra[:, i]=spec
 
     return spectra
-
@@ -1,6 +1,6 @@
 import numpy as np 
-from numpy.fft import rfftn, fftshift, irfftn
-from numpy.fft import rfft, fftshift, irfft
+from numpy.fft import rfftn, ifftshift, irfftn
+from numpy.fft import rfft, ifftshift, irfft
 
 
 """
@@ -18,7 +18,8 @@ def convolve_3d_same(cube, psf, compute_fourier=True):
     if compute_fourier then compute the fft transform of the PSF.
     if False then assumes that the fft is given.
 
-    This convolution has edge effects (and is slower when using numpy than pyfftw).
+    This convolution has edge effects (and is slower when using numpy than pyfftw). It is circular along all three axes,
+    and the PSF must be centred on pixel shape//2 (e.g. channel n_lamdas//2) of each axis.
 
     cube: The cube we want to convolve
     psf: The Point Spread Function or its Fast Fourier Transform
@@ -38,7 +39,7 @@ def convolve_3d_same(cube, psf, compute_fourier=True):
     # Convolution
     #fft_cube = np.real(fftshift(irfftn(fft_img * fft_psf, size=size, axes=[0, 1, 2]), axes=[0, 1, 2]))
 
-    convolved_cube = np.real(fftshift(irfftn(fft_img * fft_psf, axes=[0, 1, 2]), axes=[0, 1, 2]))
+    convolved_cube = np.real(ifftshift(irfftn(fft_img * fft_psf, s=size, axes=[0, 1, 2]), axes=[0, 1, 2]))
 
 
     return convolved_cube, fft_psf, fft_img
@@ -51,7 +52,8 @@ def convolve_1d_same(spec, LSF, compute_fourier=True):
     if compute_fourier then compute the fft transform of the PSF.
     if False then assumes that the fft is given.
 
-    This convolution has edge effects (and is slower when using numpy than pyfftw).
+    This convolution has edge effects (and is slower when using numpy than pyfftw). It is circular along the single axis 
+    of the spectrum, and the LSF must be centred on element len(spec)//2.
 
     cube: The cube we want to convolve
     psf: The Point Spread Function or its Fast Fourier Transform
@@ -71,7 +73,100 @@ def convolve_1d_same(spec, LSF, compute_fourier=True):
     # Convolution
     #fft_cube = np.real(fftshift(irfftn(fft_img * fft_LSF, size=size)))
 
-    convolved_spec = np.real(fftshift(irfft(fft_spec * fft_LSF)))
+    convolved_spec = np.real(ifftshift(irfft(fft_spec * fft_LSF, n=len(spec))))
 
 
-    return convolved_spec, fft_LSF, fft_spec
\ No newline at end of file
+    return convolved_spec, fft_LSF, fft_spec
+
+def chunk_length_for_memory(shape_2D, half_width, max_memory, n_temporaries=8):
+    """
+    Work out how many wavelength channels we can generate and convolve at once
+    without going over a memory budget.
+
+    Each channel of a chunk costs roughly n_temporaries float64 arrays of size shape_2D
+    (the model chunk, its Fourier transform, the PSF transform, the product and the inverse transform).
+    Every chunk also carries 2*half_width channels of overlap with it.
+
+    Args:
+        shape_2D (tuple): The (ny, nx) shape of the cube
+        half_width (int): Half width of the LSF kernel in pixels
+        max_memory (int): Memory budget in bytes
+        n_temporaries (int, optional): Number of full-chunk float64 temporaries we assume are alive at once
+
+    Returns:
+        int: the number of wavelength channels per chunk
+    """
+
+    bytes_per_channel=n_temporaries*8*shape_2D[0]*shape_2D[1]
+    chunk_length=int(max_memory//bytes_per_channel)-2*half_width
+
+    if chunk_length<1:
+        raise ValueError('A memory budget of {} bytes is too small for a cube of spatial shape {} and an LSF half width of {} pixels'.format(max_memory, shape_2D, half_width))
+
+    return chunk_length
+
+
+def convolve_3d_overlap_add(chunks, PSF_image, LSF_kernel, n_lamdas):
+    """
+    Convolve a cube with a separable PSF & LSF one wavelength chunk at a time, using overlap-add along the spectral axis.
+
+    The cube itself never needs to exist in memory: `chunks` yields (start, chunk) pairs in order, where chunk is
+    the slice cube[start:start+len(chunk)]. Each chunk is convolved with the full spatial PSF and the (short) LSF kernel,
+    and the 2*half_width channels which spill over into the next chunk are carried forward and added on.
+    Wavelength channels are yielded as soon as no later chunk can contribute to them.
+
+    The spatial convolution is circular, like convolve_3d_same. The spectral convolution is linear and truncated to the
+    original n_lamdas channels, whereas convolve_3d_same wraps around, so the two only agree more than half_width 
+    channels from either end of the cube.
+
+    Args:
+        chunks (iterable): yields (start, chunk) pairs, with chunk of shape (n_chunk, ny, nx). Must cover 0 to n_lamdas in order
+        PSF_image (array): The 2D seeing disk, centred on pixel shape//2
+        LSF_kernel (array): The 1D LSF, of odd length 2*half_width+1, centred on its middle pixel
+        n_lamdas (int): Total number of wavelength channels in the cube
+
+    Yields:
+        tuple: (start, stop, convolved) where convolved is the convolved cube between channels start and stop
+    """
+
+    LSF_kernel=np.ravel(LSF_kernel)
+    assert len(LSF_kernel)%2==1, 'The LSF kernel must have an odd number of pixels'
+    half_width=len(LSF_kernel)//2
+
+    ny, nx=PSF_image.shape
+    PSF_3d=LSF_kernel[:, None, None]*PSF_image[None, :, :]
+
+    #Transforms of the PSF for each chunk length we've seen. Only the last chunk is usually a different size
+    fft_psfs={}
+    pending=np.zeros((2*half_width, ny, nx))
+
+    next_start=0
+    for start, chunk in chunks:
+
+        assert start==next_start, 'Chunks must be contiguous and in order'
+        n_chunk=chunk.shape[0]
+        next_start=start+n_chunk
+
+        size=(n_chunk+2*half_width, ny, nx)
+        if size not in fft_psfs:
+            fft_psfs[size]=rfftn(PSF_3d, s=size, axes=[0, 1, 2])
+
+        convolved=irfftn(rfftn(chunk, s=size, axes=[0, 1, 2])*fft_psfs[size], s=size, axes=[0, 1, 2])
+        convolved=ifftshift(convolved, axes=[1, 2])
+
+        #convolved now covers channels start-half_width to next_start+half_width.
+        #The first 2*half_width of these also got light from the previous chunk
+        convolved[:2*half_width]+=pending
+        pending=convolved[n_chunk:].copy()
+
+        lo=max(start-half_width, 0)
+        hi=next_start-half_width
+        if hi>lo:
+            yield lo, hi, convolved[lo-(start-half_width):hi-(start-half_width)]
+
+    assert next_start==n_lamdas, 'Chunks must cover all {} wavelength channels'.format(n_lamdas)
+
+    #Flush the overlap from the final chunk
+    lo=max(n_lamdas-half_width, 0)
+    if n_lamdas>lo:
+        yield lo, n_lamdas, pending[lo-(n_lamdas-half_width):half_width]
@@ -157,8 +157,9 @@ def v_circ_exp_quick(R,params):
 
     #Bessel Functions
     #Interpolate to speed up!
-    I0K0 = settings.interpI0K0(half_a_R)
-    I1K1 = settings.interpI1K1(half_a_R)
+    interpI0K0, interpI1K1 = settings.bessel_interpolators()
+    I0K0 = interpI0K0(half_a_R)
+    I1K1 = interpI1K1(half_a_R)
 
     #bsl  = I0K0 - I1K1
 
@@ -187,28 +188,14 @@ def rotate_coordinates(x, y, theta):
 def _make_velocity_cube(velfield, sigma_profile, lam0, logLamdas):
 
     """
-    Turn a 2D velocity map into a 3D cube
-    """
-
+    Turn a 2D velocity map into a 3D cube. 
     
-    vel_cube=np.outer(np.ones_like(logLamdas), velfield).reshape(-1, *velfield.shape)
-
-    sig_cube=np.outer(np.ones_like(logLamdas), sigma_profile).reshape(-1, *velfield.shape)
-
-    vels=(logLamdas*const.c/1000.0)-np.log(lam0)*const.c/1000.0
-    v_start=vels[0]
-    v_stop=vels[-1]
-    dv_kms=(logLamdas[1]-logLamdas[0])*const.c/1000.0
-
-    # Create grid of velocities
-    vgrid, y, x = np.mgrid[
-        v_start: v_stop + 0.9 * dv_kms: dv_kms,
-        0: np.shape(velfield)[0],
-        0: np.shape(velfield)[1]
-    ]
+    Only depends on the wavelengths in logLamdas, so passing a slice of logLamdas gives the same slice of the full cube.
+    """
 
+    vels=(logLamdas-np.log(lam0))*const.c/1000.0
 
-    vel_cube= np.exp(-0.5 * (vgrid - vel_cube) ** 2 / (scube ** 2))
+    vel_cube=np.exp(-0.5 * (vels[:, None, None] - velfield[None, :, :]) ** 2 / (sigma_profile ** 2))
 
     return vel_cube
 
@@ -225,12 +212,31 @@ def _make_gaussian_light_profile(light_params, shape, oversample=1):
     return light_profile
 
 
-def make_deconvolved_model(params, shape, oversample, Ha_lam, logLamdas, light_profile):
+def make_deconvolved_model(params, shape, oversample, Ha_lam, logLamdas, light_profile, sigma_profile):
 
     vfield=velfield(params, shape, oversample)
-    model=_make_velocity_cube(vfield, Ha_lam, logLamdas)
+    model=_make_velocity_cube(vfield, sigma_profile, Ha_lam, logLamdas)
 
     deconvolved_model=model*light_profile
 
 
-    return deconvolved_model
\ No newline at end of file
+    return deconvolved_model
+
+
+def iter_deconvolved_model_chunks(params, shape, oversample, Ha_lam, logLamdas, light_profile, sigma_profile, chunk_length):
+
+    """
+    Make the same cube as make_deconvolved_model, but chunk_length wavelength channels at a time so that the full cube 
+    never has to be in memory. The velocity field is only computed once.
+
+    Yields:
+        tuple: (start, chunk), where chunk is the deconvolved model between channels start and start+chunk_length
+    """
+
+    vfield=velfield(params, shape, oversample)
+
+    for start in range(0, len(logLamdas), chunk_length):
+        chunk=_make_velocity_cube(vfield, sigma_profile, Ha_lam, logLamdas[start:start+chunk_length])
+        chunk*=light_profile
+
+        yield start, chunk
@@ -1,18 +1,58 @@
 import numpy as np 
 
-from . import disk_model as DM, convolutions as C, binning as B 
+from . import disk_model as DM, convolutions as C, binning as B, settings
 
 
 
-def make_final_model(disk_params, shape, oversample, Ha_lam, logLamdas, light_profile, PSF_FFT, bins, x, y):
+def make_final_model(disk_params, shape, oversample, Ha_lam, logLamdas, light_profile, sigma_profile, PSF_FFT, bins, x, y):
 
 
-    deconvolved_model=DM.make_deconvolved_model(disk_params, shape, oversample, Ha_lam, logLamdas, light_profile)
+    deconvolved_model=DM.make_deconvolved_model(disk_params, shape, oversample, Ha_lam, logLamdas, light_profile, sigma_profile)
 
-    convolved_model, _, _=C.convolve_3d_same(cube, psf, compute_fourier=False)
+    convolved_model, _, _=C.convolve_3d_same(deconvolved_model, PSF_FFT, compute_fourier=False)
 
-    binned_convolved_model=B.bin_cube(x, y, bins, convolved_cube)
+    binned_convolved_model=B.bin_cube(x, y, bins, convolved_model)
 
     return binned_convolved_model
 
 
+def make_final_model_chunked(disk_params, shape, oversample, Ha_lam, logLamdas, light_profile, sigma_profile, PSF_image, LSF_kernel, bins, x, y, max_memory=None):
+
+    """
+    A version of make_final_model which is streamed through the wavelength axis so that peak memory is set by max_memory 
+    rather than by the size of the cube. This is for large (e.g. MUSE) cubes, where the full model cube and its 
+    Fourier transforms don't fit in memory. 
+
+    The model is generated chunk by chunk, convolved using overlap-add along the wavelength axis (with the 
+    LSF half width as the overlap) and each set of finished wavelength channels is binned straight away.
+
+    This agrees with make_final_model using PSF_FFT=rfftn(gaussians.make_3d_PSF(...)) with the same seeing and LSF, 
+    except that:
+
+        * The spectral convolution here is linear, whereas make_final_model wraps around the ends of the wavelength axis.
+          So the two differ within half_width channels of either end
+        * LSF_kernel is truncated at n_sigma (see gaussians.make_LSF_kernel), so its far wings are lost
+
+    Args:
+        PSF_image (array): The 2D seeing disk, e.g. from gaussians.seeing
+        LSF_kernel (array): A short LSF of odd length, e.g. from gaussians.make_LSF_kernel
+        max_memory (int, optional): Rough upper limit on the memory used for the model and convolution temporaries, in bytes. 
+            Defaults to settings.max_chunk_memory
+
+    Returns:
+        array: a 2D array of shape (n_lamdas, n_unique_bins) of spectra
+    """
+
+    if max_memory is None:
+        max_memory=settings.max_chunk_memory
+
+    half_width=len(LSF_kernel)//2
+    chunk_length=C.chunk_length_for_memory(PSF_image.shape, half_width, max_memory)
+
+    chunks=DM.iter_deconvolved_model_chunks(disk_params, shape, oversample, Ha_lam, logLamdas, light_profile, sigma_profile, chunk_length)
+
+    binned_convolved_model=np.empty((len(logLamdas), len(np.unique(bins))))
+    for start, stop, convolved_chunk in C.convolve_3d_overlap_add(chunks, PSF_image, LSF_kernel, len(logLamdas)):
+        binned_convolved_model[start:stop]=B._sum_bins(x, y, bins, convolved_chunk)
+
+    return binned_convolved_model
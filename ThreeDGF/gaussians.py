@@ -51,7 +51,9 @@ def twoD_Gaussian(params, X, Y):
 
 def make_3d_PSF(FWHM_seeing, FWHM_LSF, shape_2D, logLamdas):
 
-    line_wave=np.median(np.exp(logLamdas))
+    #Centre the LSF on channel n_lamdas//2, which is where convolutions.convolve_3d_same expects it.
+    #The median wavelength is half a channel away from this when there are an even number of channels
+    line_wave=np.exp(logLamdas[len(logLamdas)//2])
 
     PSF_image=seeing(FWHM_seeing, shape_2D)
     LSF_spectrum=gaussian(logLamdas, line_wave, FWHM_LSF, pixel=True)
@@ -59,6 +61,34 @@ def make_3d_PSF(FWHM_seeing, FWHM_LSF, shape_2D, logLamdas):
     PSF_3d=np.rollaxis(PSF_image[..., None]*LSF_spectrum.squeeze(), -1)
 
     return PSF_3d
+
+
+def make_LSF_kernel(FWHM_LSF, logLamdas, n_sigma=5.0):
+
+    """
+    A short, odd-length LSF which only extends to n_sigma either side of its centre. 
+    Used for overlap-add convolution, where the half width of the kernel sets the overlap between wavelength chunks.
+
+    Args:
+        FWHM_LSF (float): FWHM of the LSF in Angstrom
+        logLamdas (array): np.log(wavelength) of the cube. Must be evenly spaced
+        n_sigma (float, optional): How many sigma to go out either side of the centre
+
+    Returns:
+        tuple: (kernel, half_width). The kernel has length 2*half_width+1 and sums to 1
+    """
+
+    line_wave=np.exp(logLamdas[len(logLamdas)//2])
+    dx=(logLamdas[-1]-logLamdas[0])/(logLamdas.size-1)
+    xsig=FWHM_LSF/2.355/line_wave/dx
+
+    half_width=max(int(np.ceil(n_sigma*xsig)), 1)
+    logLam_kernel=np.log(line_wave)+dx*np.arange(-half_width, half_width+1)
+
+    kernel=gaussian(logLam_kernel, line_wave, FWHM_LSF, pixel=True).squeeze()
+
+    return kernel/kernel.sum(), half_width
+
 #From Michele Cappellari's ppxf
 
 ###############################################################################
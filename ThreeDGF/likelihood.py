@@ -0,0 +1,131 @@
+import numpy as np 
+
+
+
+class BinnedChiSquared():
+
+    """
+    Chi-squared between binned model spectra and the binned data. 
+
+    Everything which doesn't depend on the model is done once, when this is made: the inverse variances are precomputed,
+    masked pixels (sky lines, detector gaps, bad noise values) are thrown away and the remaining data are packed into 
+    a 1D array. Each call then gathers the valid model pixels a block at a time into a small work buffer, subtracts, 
+    weights and reduces them there. The work buffer has a fixed size (max_buffer_size elements) whatever the number
+    of models or pixels, and is kept between calls.
+
+    Models are used in their own floating point type (so float32 models aren't copied to float64 first), with the sum 
+    done in float64. Anything else, e.g. integer models, is converted to float64.
+
+    The work buffers are reused between calls, so one instance shouldn't be shared between threads.
+
+    Args:
+        data (array): Binned data, shape (n_lamdas, n_bins), as from binning.bin_cube
+        noise (array): 1 sigma errors on data, same shape
+        good_pixels (array, optional): Boolean mask which is True for pixels to use. Can be (n_lamdas, n_bins), or (n_lamdas,) 
+            to use the same wavelength mask for every bin. Pixels where the data or noise aren't finite, or the noise isn't positive,
+            are always masked
+        max_buffer_size (int, optional): Number of elements in the work buffer
+    """
+
+    def __init__(self, data, noise, good_pixels=None, max_buffer_size=2**18):
+
+        data=np.asarray(data, dtype=np.float64)
+        noise=np.asarray(noise, dtype=np.float64)
+
+        if data.ndim!=2:
+            raise ValueError('data must be 2D, with shape (n_lamdas, n_bins)')
+        if noise.shape!=data.shape:
+            raise ValueError('data and noise must be the same shape')
+
+        good=np.isfinite(data)&np.isfinite(noise)&(noise>0)
+        if good_pixels is not None:
+            good_pixels=np.asarray(good_pixels, dtype=bool)
+            if good_pixels.ndim==1:
+                good_pixels=good_pixels[:, None]
+            good&=np.broadcast_to(good_pixels, data.shape)
+
+        self.shape=data.shape
+        self.n_valid=int(good.sum())
+        if self.n_valid==0:
+            raise ValueError('No unmasked pixels left to compare to')
+
+        #Indices of the valid pixels in the flattened (n_lamdas, n_bins) array, and the packed data and weights at those pixels
+        self._index=np.flatnonzero(good)
+        self._data=data.ravel()[self._index]
+        self.inv_var=1.0/noise.ravel()[self._index]**2
+        self._sqrt_inv_var=np.sqrt(self.inv_var)
+
+        #Reduce in blocks of up to block_pixels pixels and block_models models, so the buffer never holds more than max_buffer_size elements
+        self.block_pixels=int(min(self.n_valid, max(max_buffer_size, 1)))
+        self.block_models=int(max(max_buffer_size//self.block_pixels, 1))
+
+        #One flat work buffer for each floating point type we've been given models in
+        self._work={}
+
+    def __call__(self, model):
+
+        return self.chi2(model)
+
+    def chi2(self, model):
+
+        """
+        Chi-squared of one binned model, of shape (n_lamdas, n_bins)
+        """
+
+        model=self._as_float(model)
+        if model.shape!=self.shape:
+            raise ValueError('model has shape {} but the data have shape {}'.format(model.shape, self.shape))
+
+        return self._packed_chi2(model.reshape(1, -1))[0]
+
+    def chi2_batch(self, models):
+
+        """
+        Chi-squared of each of a batch of N binned models, of shape (N, n_lamdas, n_bins). Returns an array of length N
+        """
+
+        models=self._as_float(models)
+        if models.shape[1:]!=self.shape:
+            raise ValueError('models have shape {} but need to be (N,)+{}'.format(models.shape, self.shape))
+
+        return self._packed_chi2(models.reshape(models.shape[0], -1))
+
+    def log_likelihood(self, model):
+
+        return -0.5*self.chi2(model)
+
+    @staticmethod
+    def _as_float(models):
+
+        models=np.asarray(models)
+        if not np.issubdtype(models.dtype, np.floating):
+            models=models.astype(np.float64)
+
+        return models
+
+    def _packed_chi2(self, flat_models):
+
+        n_models=flat_models.shape[0]
+        dtype=flat_models.dtype
+        if dtype not in self._work:
+            self._work[dtype]=np.empty(self.block_models*self.block_pixels, dtype=dtype)
+        buffer=self._work[dtype]
+
+        chi2=np.zeros(n_models)
+        for p0 in range(0, self.n_valid, self.block_pixels):
+            p1=min(p0+self.block_pixels, self.n_valid)
+            index=self._index[p0:p1]
+
+            for m0 in range(0, n_models, self.block_models):
+                m1=min(m0+self.block_models, n_models)
+                work=buffer[:(m1-m0)*(p1-p0)].reshape(m1-m0, p1-p0)
+
+                #Gather the valid pixels straight into the work buffer, then do the residual and weighting in place.
+                #mode='clip' stops np.take making its own buffered copy (the indices are always in range)
+                np.take(flat_models[m0:m1], index, axis=1, out=work, mode='clip')
+                work-=self._data[p0:p1]
+                work*=self._sqrt_inv_var[p0:p1]
+
+                chi2[m0:m1]+=np.einsum('ij,ij->i', work, work, dtype=np.float64)
+
+        return chi2
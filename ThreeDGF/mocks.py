@@ -0,0 +1,258 @@
+import numpy as np 
+import time
+import scipy.constants as const
+
+from . import disk_model as DM, convolutions as C, binning as B, gaussians as G, fitting as F, likelihood as L, settings
+
+
+"""
+Synthetic datacubes for scale and stress testing. 
+
+make_mock_cube builds a reproducible, noisy, binned cube from a disk model, a Gaussian light profile, 
+a seeing disk and LSF and a simple Voronoi-like binning. write_mock_cube makes the same cube a chunk of wavelengths
+at a time and streams it to a .npy file, so it can be much larger than memory. 
+recovery_harness fits mock cubes of different sizes and times each fit, to show how the code scales.
+"""
+
+
+def default_disk_params(shape):
+
+    """
+    Disk parameters centred in a cube of the given (ny, nx) shape, with a scale length of a sixth of the cube
+    """
+
+    return {'PA':45.0, 'xc':shape[1]/2.0, 'yc':shape[0]/2.0, 'v0':20.0, 'log_r0':np.log10(min(shape)/6.0), 'log_s0':10.0, 'theta':45.0}
+
+
+def voronoi_like_bins(shape, n_bins, seed=0):
+
+    """
+    A cheap stand in for Voronoi binning: scatter n_bins generators over the cube (more densely near the centre,
+    like S/N based binning would) and give each spaxel to its nearest generator.
+
+    Args:
+        shape (tuple): The (ny, nx) shape of the cube
+        n_bins (int): Number of generators. Generators which get no spaxels are dropped, so there can be slightly fewer bins
+        seed (int, optional): Random seed
+
+    Returns:
+        tuple: (x, y, bins), 1D arrays with the x and y position and bin number of each spaxel, in the format used by binning.bin_cube
+    """
+
+    ny, nx=shape
+    if not 1<=n_bins<=ny*nx:
+        raise ValueError('Must have between 1 and {} bins'.format(ny*nx))
+
+    rng=np.random.RandomState(seed)
+    gen_x=np.clip(rng.normal(nx/2.0, nx/4.0, n_bins), 0, nx-1)
+    gen_y=np.clip(rng.normal(ny/2.0, ny/4.0, n_bins), 0, ny-1)
+
+    y, x=np.indices(shape)
+    x=x.ravel()
+    y=y.ravel()
+
+    #Find the nearest generator a block of spaxels at a time, to keep the distance array small for big cubes
+    nearest=np.empty(x.size, dtype=int)
+    block=max(1, 2**22//n_bins)
+    for start in range(0, x.size, block):
+        d2=(x[start:start+block, None]-gen_x[None, :])**2+(y[start:start+block, None]-gen_y[None, :])**2
+        nearest[start:start+block]=np.argmin(d2, axis=1)
+
+    #Number the bins 0 to n-1 with no gaps
+    _, bins=np.unique(nearest, return_inverse=True)
+
+    return x, y, bins
+
+
+def _mock_setup(shape, n_lamdas, seeing_FWHM, n_bins, params, sigma, lam0, FWHM_LSF, velscale, seed):
+
+    if params is None:
+        params=default_disk_params(shape)
+
+    logLamdas=np.log(lam0)+(np.arange(n_lamdas)-n_lamdas//2)*velscale/(const.c/1000.0)
+
+    light_params={'X':params['xc'], 'Y':params['yc'], 'ROTATION':params['PA']*np.pi/180., 'XWIDTH':shape[1]/6.0, 'YWIDTH':shape[0]/8.0, 'OFFSET':0.0, 'Amp':1.0}
+    light_profile=DM._make_gaussian_light_profile(light_params, shape)
+    sigma_profile=np.full(shape, float(sigma))
+
+    PSF_image=G.seeing(seeing_FWHM, shape)
+    LSF_kernel, _=G.make_LSF_kernel(FWHM_LSF, logLamdas)
+
+    x, y, bins=voronoi_like_bins(shape, n_bins, seed=seed)
+
+    return {'params':params, 'logLamdas':logLamdas, 'lam0':lam0, 'light_profile':light_profile, 'sigma_profile':sigma_profile,
+            'PSF_image':PSF_image, 'LSF_kernel':LSF_kernel, 'x':x, 'y':y, 'bins':bins}
+
+
+def iter_mock_cube_chunks(shape, n_lamdas, sn, seeing_FWHM, n_bins, params=None, sigma=50.0, lam0=6563.0, FWHM_LSF=2.5, velscale=30.0, seed=0, max_memory=None):
+
+    """
+    Make a noisy mock cube a chunk of wavelength channels at a time. See make_mock_cube for the arguments.
+
+    The noise is drawn from one random stream in channel order, so the cube is the same whatever the memory budget.
+
+    Returns:
+        tuple: (mock, chunks). mock is the dictionary of everything needed to model the cube (see make_mock_cube), 
+        and chunks yields (start, stop, noisy_chunk) in wavelength order
+    """
+
+    mock=_mock_setup(shape, n_lamdas, seeing_FWHM, n_bins, params, sigma, lam0, FWHM_LSF, velscale, seed)
+
+    #S/N of the line peak in the brightest spaxel, before convolution
+    mock['noise_per_spaxel']=mock['light_profile'].max()/sn
+    mock['sn']=sn
+
+    if max_memory is None:
+        max_memory=settings.max_chunk_memory
+
+    half_width=len(mock['LSF_kernel'])//2
+    chunk_length=C.chunk_length_for_memory(shape, half_width, max_memory)
+    #Seeding with an array gives a different stream from RandomState(seed), which placed the bins. 
+    #Otherwise the first noise values would repeat the deviates that placed the bin generators
+    rng=np.random.RandomState([seed, 1])
+
+    def chunks():
+
+        model_chunks=DM.iter_deconvolved_model_chunks(mock['params'], shape, 1, lam0, mock['logLamdas'], mock['light_profile'], mock['sigma_profile'], chunk_length)
+        for start, stop, convolved_chunk in C.convolve_3d_overlap_add(model_chunks, mock['PSF_image'], mock['LSF_kernel'], n_lamdas):
+            yield start, stop, convolved_chunk+mock['noise_per_spaxel']*rng.standard_normal(convolved_chunk.shape)
+
+    return mock, chunks()
+
+
+def make_mock_cube(shape, n_lamdas, sn, seeing_FWHM, n_bins, params=None, sigma=50.0, lam0=6563.0, FWHM_LSF=2.5, velscale=30.0, seed=0, max_memory=None, keep_cube=False):
+
+    """
+    Make a reproducible, noisy, binned mock cube.
+
+    Args:
+        shape (tuple): (ny, nx) size of the cube in spaxels
+        n_lamdas (int): Number of wavelength channels
+        sn (float): Signal to noise of the line peak in the brightest spaxel (before convolution). The noise is the same in every spaxel
+        seeing_FWHM (float): FWHM of the seeing disk, in spaxels
+        n_bins (int): Rough number of Voronoi-like bins
+        params (dict, optional): Disk parameters. Defaults to default_disk_params(shape)
+        sigma (float, optional): Velocity dispersion in km/s, the same everywhere
+        lam0 (float, optional): Rest wavelength of the line
+        FWHM_LSF (float, optional): FWHM of the LSF, in the same units as lam0
+        velscale (float, optional): Size of a wavelength channel in km/s
+        seed (int, optional): Random seed for the bins and the noise
+        max_memory (int, optional): Memory budget for making the cube, as in fitting.make_final_model_chunked. Defaults to settings.max_chunk_memory
+        keep_cube (bool, optional): Also return the unbinned noisy cube. Don't do this for large cubes
+
+    Returns:
+        dict: The binned spectra ('data', shape (n_lamdas, n_bins)) and their noise ('noise'), plus everything else needed 
+        to model the cube: 'params', 'logLamdas', 'lam0', 'light_profile', 'sigma_profile', 'PSF_image', 'LSF_kernel', 'x', 'y' and 'bins'
+    """
+
+    mock, chunks=iter_mock_cube_chunks(shape, n_lamdas, sn, seeing_FWHM, n_bins, params=params, sigma=sigma, lam0=lam0, FWHM_LSF=FWHM_LSF, velscale=velscale, seed=seed, max_memory=max_memory)
+
+    n_bins_actual=len(np.unique(mock['bins']))
+    data=np.empty((n_lamdas, n_bins_actual))
+    if keep_cube:
+        mock['cube']=np.empty((n_lamdas,)+tuple(shape))
+
+    for start, stop, noisy_chunk in chunks:
+        data[start:stop]=B._sum_bins(mock['x'], mock['y'], mock['bins'], noisy_chunk)
+        if keep_cube:
+            mock['cube'][start:stop]=noisy_chunk
+
+    #The spectra are summed in each bin, so the noise adds in quadrature
+    n_spaxels=np.bincount(mock['bins'])
+    mock['data']=data
+    mock['noise']=np.outer(np.ones(n_lamdas), np.sqrt(n_spaxels)*mock['noise_per_spaxel'])
+
+    return mock
+
+
+def write_mock_cube(filename, shape, n_lamdas, sn, seeing_FWHM, n_bins, **kwargs):
+
+    """
+    Stream a noisy mock cube to a .npy file, one wavelength chunk at a time, so the cube never has to fit in memory.
+    Takes the same arguments as make_mock_cube. Read it back with np.load(filename, mmap_mode='r').
+
+    Returns:
+        dict: Everything needed to model the cube, as in make_mock_cube, but without the binned data
+    """
+
+    mock, chunks=iter_mock_cube_chunks(shape, n_lamdas, sn, seeing_FWHM, n_bins, **kwargs)
+
+    cube=np.lib.format.open_memmap(filename, mode='w+', dtype=np.float64, shape=(n_lamdas,)+tuple(shape))
+    for start, stop, noisy_chunk in chunks:
+        cube[start:stop]=noisy_chunk
+        cube.flush()
+    del cube
+
+    return mock
+
+
+def recovery_harness(sizes, n_lamdas=200, sn=20.0, seeing_FWHM=3.0, spaxels_per_bin=10, fit_params=('PA', 'v0', 'log_r0', 'theta'), offsets=None, seed=0, max_memory=None, **minimize_kwargs):
+
+    """
+    Fit mock cubes over a grid of sizes and time each fit, to check that we get the parameters back and to see how the code scales.
+
+    Each cube is fit by minimising chi-squared over fit_params with scipy.optimize.minimize, starting from the true 
+    parameters plus offsets. The other disk parameters, the light profile, the seeing and the LSF are fixed at their true values.
+
+    Args:
+        sizes (list): (ny, nx) cube shapes to try
+        spaxels_per_bin (int, optional): Average number of spaxels in each bin
+        fit_params (tuple, optional): Which disk parameters to fit
+        offsets (dict, optional): How far from the truth to start each parameter. Defaults to 5 degrees for angles and 10% otherwise
+        **minimize_kwargs: passed to scipy.optimize.minimize. Defaults to method='Nelder-Mead'
+
+    Returns:
+        list: A dictionary for each size, with 'shape', 'n_lamdas', 'n_bins', 'true' and 'recovered' parameters, 
+        'chi2', 'n_evaluations', 'time' (seconds for the whole fit) and 'time_per_evaluation'
+    """
+
+    import scipy.optimize as so
+
+    minimize_kwargs.setdefault('method', 'Nelder-Mead')
+    results=[]
+
+    for shape in sizes:
+
+        shape=tuple(shape)
+        n_bins=max(1, (shape[0]*shape[1])//spaxels_per_bin)
+        mock=make_mock_cube(shape, n_lamdas, sn, seeing_FWHM, n_bins, seed=seed, max_memory=max_memory)
+        true_params=mock['params']
+
+        if offsets is None:
+            start_offsets={p:(5.0 if p in ('PA', 'theta') else 0.1*abs(true_params[p])) for p in fit_params}
+        else:
+            start_offsets=offsets
+
+        chi2_of_model=L.BinnedChiSquared(mock['data'], mock['noise'])
+        n_evaluations=[0]
+
+        def chi2(values):
+
+            n_evaluations[0]+=1
+            trial=dict(true_params)
+            trial.update(zip(fit_params, values))
+
+            model=F.make_final_model_chunked(trial, shape, 1, mock['lam0'], mock['logLamdas'], mock['light_profile'], mock['sigma_profile'], 
+                mock['PSF_image'], mock['LSF_kernel'], mock['bins'], mock['x'], mock['y'], max_memory=max_memory)
+
+            return chi2_of_model(model)
+
+        x0=[true_params[p]+start_offsets[p] for p in fit_params]
+
+        t0=time.perf_counter()
+        fit=so.minimize(chi2, x0, **minimize_kwargs)
+        fit_time=time.perf_counter()-t0
+
+        results.append({
+            'shape':shape,
+            'n_lamdas':n_lamdas,
+            'n_bins':mock['data'].shape[1],
+            'true':{p:true_params[p] for p in fit_params},
+            'recovered':dict(zip(fit_params, fit.x)),
+            'chi2':fit.fun,
+            'n_evaluations':n_evaluations[0],
+            'time':fit_time,
+            'time_per_evaluation':fit_time/max(n_evaluations[0], 1)
+            })
+
+    return results
@@ -0,0 +1,312 @@
+import numpy as np 
+import os
+import glob
+import time
+import queue
+import threading
+
+
+"""
+Streaming storage for long sampling runs. 
+
+The sampler hands each step to a ResultsWriter, which copies it into a fixed-size batch. Full batches are written to disk 
+as a shard of .npy files by a background thread, so sampling never waits on I/O. ResultsReader memory-maps the shards 
+back for post-processing, so only the steps you ask for are ever read.
+
+Shards are written to e.g. directory/chain_00003.npy, directory/log_prob_00003.npy and (optionally) directory/model_00003.npy
+"""
+
+_names=('chain', 'log_prob', 'model')
+
+
+def _shard_path(directory, name, shard):
+
+    return os.path.join(directory, '{}_{:05d}.npy'.format(name, shard))
+
+
+class ResultsWriter():
+
+    """
+    Append sampler chains, log-probabilities and (optionally) thinned binned models to .npy shards on disk from a background thread.
+
+    Args:
+        directory (str): Where to put the shards. Made if it doesn't exist
+        batch_size (int, optional): Number of sampler steps in each shard
+        model_thin (int, optional): Keep the model from every model_thin-th step. If None, models aren't kept
+        max_queued_batches (int, optional): How many full batches can wait to be written before append blocks. Bounds the memory used
+
+    Use as a context manager, or call close() at the end of the run so the final (partial) batch gets written.
+    """
+
+    def __init__(self, directory, batch_size=1000, model_thin=None, max_queued_batches=4):
+
+        if batch_size<1:
+            raise ValueError('batch_size must be at least 1')
+        if model_thin is not None and model_thin<1:
+            raise ValueError('model_thin must be at least 1, or None')
+
+        self.directory=directory
+        self.batch_size=batch_size
+        self.model_thin=model_thin
+
+        os.makedirs(directory, exist_ok=True)
+        if glob.glob(os.path.join(directory, '*_[0-9][0-9][0-9][0-9][0-9].npy')):
+            raise ValueError('{} already contains results shards'.format(directory))
+
+        self.n_steps=0
+        self.n_shards=0
+        self._buffers=None
+        self._n_in_batch=0
+        self._n_models_in_batch=0
+
+        #Time the sampler spent inside append/close, and time the background thread spent writing
+        self.append_time=0.0
+        self.write_time=0.0
+        self.start_time=time.perf_counter()
+
+        self._error=None
+        self._closed=False
+        self._queue=queue.Queue(maxsize=max_queued_batches)
+        self._thread=threading.Thread(target=self._write_batches, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        if exc_type is None:
+            self.close()
+            return
+
+        #Something already went wrong in the with block. Still stop the writer, but don't hide the original exception behind a writer error
+        try:
+            self.close()
+        except RuntimeError:
+            pass
+
+    def append(self, chain, log_prob, model=None):
+
+        """
+        Add one sampler step. 
+
+        Args:
+            chain (array): Positions of the walkers at this step, e.g. shape (n_walkers, n_dim)
+            log_prob (array): log-probability of each walker, e.g. shape (n_walkers,)
+            model (array, optional): The binned model(s) at this step. Only kept every model_thin steps
+        """
+
+        t0=time.perf_counter()
+        self._check_open()
+        self._check_for_errors()
+
+        keep_model=(self.model_thin is not None) and (model is not None) and (self.n_steps%self.model_thin==0)
+
+        if self._buffers is None:
+            self._buffers=self._new_buffers(chain, log_prob, model if keep_model else None)
+        elif keep_model and self._buffers['model'] is None:
+            self._buffers['model']=np.empty((self._n_models_per_batch(),)+np.shape(model))
+
+        self._buffers['chain'][self._n_in_batch]=chain
+        self._buffers['log_prob'][self._n_in_batch]=log_prob
+        if keep_model:
+            self._buffers['model'][self._n_models_in_batch]=model
+            self._n_models_in_batch+=1
+
+        self._n_in_batch+=1
+        self.n_steps+=1
+
+        if self._n_in_batch==self.batch_size:
+            self._submit_batch()
+
+        self.append_time+=time.perf_counter()-t0
+
+    def flush(self):
+
+        """
+        Send any partial batch to the writer and wait for everything queued so far to reach the disk.
+        """
+
+        t0=time.perf_counter()
+        self._check_open()
+
+        if self._n_in_batch>0:
+            self._submit_batch()
+        self._queue.join()
+        self._check_for_errors()
+
+        self.append_time+=time.perf_counter()-t0
+
+    def close(self):
+
+        """
+        Write everything and stop the background thread. The writer can't be used after this. Closing it again does nothing.
+        """
+
+        if self._closed:
+            return
+
+        t0=time.perf_counter()
+        try:
+            self.flush()
+        finally:
+            self._closed=True
+            self._queue.put(None)
+            self._thread.join()
+            self.append_time+=time.perf_counter()-t0
+
+    def overhead_fraction(self, sampling_time=None):
+
+        """
+        The time the sampler spent blocked on the writer, as a fraction of the sampling time. 
+        If sampling_time isn't given, use the wall time since the writer was made.
+        """
+
+        if sampling_time is None:
+            sampling_time=time.perf_counter()-self.start_time
+
+        return self.append_time/sampling_time
+
+    def _new_buffers(self, chain, log_prob, model):
+
+        buffers={
+        'chain':np.empty((self.batch_size,)+np.shape(chain)),
+        'log_prob':np.empty((self.batch_size,)+np.shape(log_prob)),
+        'model':None
+        }
+        if model is not None:
+            buffers['model']=np.empty((self._n_models_per_batch(),)+np.shape(model))
+
+        return buffers
+
+    def _n_models_per_batch(self):
+
+        #At most this many steps in any batch are multiples of model_thin
+        return -(-self.batch_size//self.model_thin)
+
+    def _submit_batch(self):
+
+        #Hand the filled part of the buffers to the writer thread, then start on new ones. 
+        #The old buffers now belong to the writer, so we can't reuse them
+        batch={
+        'chain':self._buffers['chain'][:self._n_in_batch],
+        'log_prob':self._buffers['log_prob'][:self._n_in_batch],
+        }
+        if self._buffers['model'] is not None and self._n_models_in_batch>0:
+            batch['model']=self._buffers['model'][:self._n_models_in_batch]
+
+        self._queue.put((self.n_shards, batch))
+        self.n_shards+=1
+
+        self._buffers={name:(None if buf is None else np.empty_like(buf)) for name, buf in self._buffers.items()}
+        self._n_in_batch=0
+        self._n_models_in_batch=0
+
+    def _write_batches(self):
+
+        while True:
+            item=self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is not None:
+                    continue
+
+                t0=time.perf_counter()
+                shard, batch=item
+                for name, array in batch.items():
+                    #Write to a temporary file then move it, so a reader never sees half a shard
+                    path=_shard_path(self.directory, name, shard)
+                    tmp_path=path+'.tmp'
+                    with open(tmp_path, 'wb') as f:
+                        np.save(f, array)
+                    os.replace(tmp_path, path)
+                self.write_time+=time.perf_counter()-t0
+
+            except Exception as e:
+                self._error=e
+            finally:
+                self._queue.task_done()
+
+    def _check_open(self):
+
+        #Nothing reads the queue once the background thread has stopped, so anything put on it would never be written
+        if self._closed:
+            raise ValueError('The ResultsWriter for {} has been closed'.format(self.directory))
+
+    def _check_for_errors(self):
+
+        if self._error is not None:
+            raise RuntimeError('Writing results to {} failed'.format(self.directory)) from self._error
+
+
+class ResultsReader():
+
+    """
+    Memory-mapped access to the shards made by a ResultsWriter. Nothing is read from disk until it's sliced.
+
+    Args:
+        directory (str): The directory the ResultsWriter wrote to
+    """
+
+    def __init__(self, directory):
+
+        self.directory=directory
+        self.shards={name:self._load_shards(name) for name in _names}
+
+        if len(self.shards['chain'])==0:
+            raise ValueError('No results shards found in {}'.format(directory))
+
+    def __len__(self):
+
+        return sum(len(s) for s in self.shards['chain'])
+
+    def _load_shards(self, name):
+
+        paths=sorted(glob.glob(os.path.join(self.directory, '{}_[0-9][0-9][0-9][0-9][0-9].npy'.format(name))))
+
+        return [np.load(p, mmap_mode='r') for p in paths]
+
+    def read(self, name, start=0, stop=None):
+
+        """
+        Get steps start to stop of 'chain', 'log_prob' or 'model' as one array. Only the shards which overlap 
+        that range are touched. For 'model', start and stop count stored (thinned) models, not sampler steps.
+        """
+
+        if name not in _names:
+            raise ValueError('name must be one of {}'.format(_names))
+
+        shards=self.shards[name]
+        n_total=sum(len(s) for s in shards)
+        start, stop, _=slice(start, stop).indices(n_total)
+
+        pieces=[]
+        offset=0
+        for s in shards:
+            lo=max(start-offset, 0)
+            hi=min(stop-offset, len(s))
+            if hi>lo:
+                pieces.append(s[lo:hi])
+            offset+=len(s)
+
+        if len(pieces)==0:
+            return np.empty((0,)+(shards[0].shape[1:] if shards else ()))
+
+        return np.concatenate(pieces)
+
+    @property
+    def chain(self):
+
+        return self.read('chain')
+
+    @property
+    def log_prob(self):
+
+        return self.read('log_prob')
+
+    @property
+    def models(self):
+
+        return self.read('model')
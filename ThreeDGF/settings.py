@@ -1,6 +1,4 @@
 import numpy as np 
-from scipy.special import iv, kv
-import scipy.interpolate as si
 
 def interpolators_for_bessel_functions():
 
@@ -8,6 +6,10 @@ def interpolators_for_bessel_functions():
     #I've tested this against the true arrays of I0K0 and I1K1. The median difference is 10^(-10) and 10^(-12) 
     #respectively. Largest difference is 10^-9.
 
+    #Imported here so that importing settings (and so disk_model) stays cheap
+    from scipy.special import iv, kv
+    import scipy.interpolate as si
+
     x=np.logspace(-4.0, 2.0, 1000000)
     
     I0K0 = iv(0,x)*kv(0,x)
@@ -18,7 +20,21 @@ def interpolators_for_bessel_functions():
 
     return interpI0K0, interpI1K1
 
-interpI0K0, interpI1K1=interpolators_for_bessel_functions()
+
+_bessel_interpolators=None
+
+def bessel_interpolators():
+
+    """
+    The (interpI0K0, interpI1K1) look up tables. These take most of a second to make, so they're only built the first 
+    time they're needed (rather than at import, which every pool worker and short job would pay for) and then kept.
+    """
+
+    global _bessel_interpolators
+    if _bessel_interpolators is None:
+        _bessel_interpolators=interpolators_for_bessel_functions()
+
+    return _bessel_interpolators
 
 
 #Settings
@@ -33,3 +49,6 @@ max_centre_shift=5
 #excluded from the kinematic fitting
 fraction_of_peak=0.1
 
+
+#Rough upper limit, in bytes, on the memory used by fitting.make_final_model_chunked for the model cube and its convolution
+max_chunk_memory=2*1024**3
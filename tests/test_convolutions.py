@@ -0,0 +1,133 @@
+import unittest
+import numpy as np
+
+from ThreeDGF import convolutions as C
+from ThreeDGF import gaussians as G
+from ThreeDGF import disk_model as DM
+from ThreeDGF import fitting as F
+from numpy.fft import rfftn
+import scipy.constants as const
+
+
+def _chunks(cube, chunk_length):
+
+    for start in range(0, cube.shape[0], chunk_length):
+        yield start, cube[start:start+chunk_length]
+
+
+def _overlap_add(cube, PSF_image, LSF_kernel, chunk_length):
+
+    convolved=np.full(cube.shape, np.nan)
+    for start, stop, convolved_chunk in C.convolve_3d_overlap_add(_chunks(cube, chunk_length), PSF_image, LSF_kernel, cube.shape[0]):
+        convolved[start:stop]=convolved_chunk
+
+    return convolved
+
+
+class Test_Overlap_Add_Convolution(unittest.TestCase):
+
+    def setUp(self):
+
+        np.random.seed(1)
+        self.cube=np.random.rand(100, 8, 10)
+        self.PSF_image=G.seeing(2.0, (8, 10))
+
+        self.logLamdas=np.linspace(np.log(0.779999971389771), np.log(1.0898486661608342), 100)
+        self.LSF_kernel, self.half_width=G.make_LSF_kernel(0.01, self.logLamdas)
+
+    def test_LSF_kernel_is_odd_and_normalised(self):
+
+        self.assertEqual(len(self.LSF_kernel), 2*self.half_width+1)
+        self.assertTrue(np.allclose(self.LSF_kernel.sum(), 1.0))
+        self.assertEqual(np.argmax(self.LSF_kernel), self.half_width)
+
+    def test_delta_PSF_matches_spectral_convolution(self):
+
+        #A delta function seeing disk at shape/2 should leave the spatial axes alone
+        PSF_image=np.zeros((8, 10))
+        PSF_image[4, 5]=1.0
+
+        convolved=_overlap_add(self.cube, PSF_image, self.LSF_kernel, 7)
+
+        expected=np.apply_along_axis(np.convolve, 0, self.cube, self.LSF_kernel, mode='same')
+
+        self.assertTrue(np.allclose(convolved, expected))
+
+    def test_result_independent_of_chunk_length(self):
+
+        single_chunk=_overlap_add(self.cube, self.PSF_image, self.LSF_kernel, self.cube.shape[0])
+
+        for chunk_length in [1, self.half_width, 2*self.half_width+1, 33]:
+            chunked=_overlap_add(self.cube, self.PSF_image, self.LSF_kernel, chunk_length)
+            self.assertTrue(np.allclose(chunked, single_chunk))
+
+    def test_too_small_memory_budget_fails(self):
+
+        self.assertRaises(ValueError, C.chunk_length_for_memory, (300, 300), 10, 1000)
+
+    def test_chunked_model_independent_of_memory_budget(self):
+
+        params={'PA':45.0, 'xc':13.0, 'yc':17.0, 'v0':20.0, 'log_r0':1.0, 'log_s0' :10.0, 'theta':45.0}
+        shape=(30, 30)
+        lam0=np.exp(np.median(self.logLamdas))
+        light_profile=G.seeing(10.0, shape)
+        sigma_profile=np.full(shape, 3000.0)
+        PSF_image=G.seeing(3.0, shape)
+
+        y, x=np.indices(shape)
+        x=x.ravel()
+        y=y.ravel()
+        bins=(y//10)*3+(x//10)
+
+        args=(params, shape, 1, lam0, self.logLamdas, light_profile, sigma_profile, PSF_image, self.LSF_kernel, bins, x, y)
+        per_channel=8*8*shape[0]*shape[1]
+
+        small=F.make_final_model_chunked(*args, max_memory=per_channel*(2*self.half_width+5))
+        large=F.make_final_model_chunked(*args, max_memory=per_channel*(2*self.half_width+len(self.logLamdas)))
+
+        self.assertEqual(small.shape, (len(self.logLamdas), 9))
+        self.assertTrue(np.allclose(small, large))
+
+    def test_chunked_model_reads_memory_budget_from_settings(self):
+
+        from ThreeDGF import settings
+
+        shape=(30, 30)
+        y, x=np.indices(shape)
+        bins=np.arange(shape[0]*shape[1])
+        args=({}, shape, 1, 1.0, self.logLamdas, None, None, G.seeing(3.0, shape), self.LSF_kernel, bins, x.ravel(), y.ravel())
+
+        old_budget=settings.max_chunk_memory
+        settings.max_chunk_memory=1000
+        try:
+            self.assertRaises(ValueError, F.make_final_model_chunked, *args)
+        finally:
+            settings.max_chunk_memory=old_budget
+
+    def test_chunked_model_matches_in_memory_model(self):
+
+        params={'PA':45.0, 'xc':12.0, 'yc':11.0, 'v0':20.0, 'log_r0':0.6, 'log_s0' :10.0, 'theta':45.0}
+        lam0=6563.0
+        FWHM_seeing=3.0
+        FWHM_LSF=2.5
+
+        for n_lamdas, shape in [(200, (24, 24)), (201, (23, 25))]:
+
+            logLamdas=np.log(lam0)+(np.arange(n_lamdas)-n_lamdas//2)*30.0/(const.c/1000.0)
+            light_profile=G.seeing(8.0, shape)
+            sigma_profile=np.full(shape, 50.0)
+
+            y, x=np.indices(shape)
+            x=x.ravel()
+            y=y.ravel()
+            bins=(y//6)*5+(x//6)
+
+            PSF_FFT=rfftn(G.make_3d_PSF(FWHM_seeing, FWHM_LSF, shape, logLamdas), axes=[0, 1, 2])
+            in_memory=F.make_final_model(params, shape, 1, lam0, logLamdas, light_profile, sigma_profile, PSF_FFT, bins, x, y)
+
+            LSF_kernel, half_width=G.make_LSF_kernel(FWHM_LSF, logLamdas)
+            chunked=F.make_final_model_chunked(params, shape, 1, lam0, logLamdas, light_profile, sigma_profile, G.seeing(FWHM_seeing, shape), LSF_kernel, bins, x, y)
+
+            #Away from the ends of the wavelength axis, where the circular and linear convolutions differ
+            middle=slice(half_width, n_lamdas-half_width)
+            self.assertTrue(np.allclose(chunked[middle], in_memory[middle], rtol=0, atol=1e-4*in_memory.max()))
@@ -0,0 +1,49 @@
+import unittest
+import os
+import subprocess
+import sys
+
+
+#Budget for the time ThreeDGF.fitting adds on top of importing the libraries it depends on, as a fraction of the time
+#those libraries take to import, so it scales with the speed of the machine. ThreeDGF itself adds ~2% now. 
+#Building the Bessel tables at import added ~450%, and importing scipy.special and scipy.interpolate for them ~150%
+import_time_budget=0.5
+
+repo_root=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(code, *args):
+
+    return subprocess.run([sys.executable]+list(args)+['-c', code], cwd=repo_root, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+
+class Test_Import_Time(unittest.TestCase):
+
+    def test_fitting_import_time_within_budget(self):
+
+        #In a fresh interpreter, time importing the dependencies and then time what ThreeDGF.fitting adds on top.
+        #Take the best of a few tries so a busy machine doesn't fail the test
+        code=(
+            'import time\n'
+            't0=time.perf_counter()\n'
+            'import numpy, scipy.ndimage, scipy.constants, scipy.fftpack\n'
+            't1=time.perf_counter()\n'
+            'import ThreeDGF.fitting\n'
+            't2=time.perf_counter()\n'
+            'print((t2-t1)/(t1-t0))'
+            )
+
+        import_time_ratio=min(float(_run(code).stdout) for _ in range(3))
+
+        self.assertLess(import_time_ratio, import_time_budget)
+
+    def test_fitting_import_is_lazy(self):
+
+        code=(
+            'import sys\n'
+            'import ThreeDGF.fitting, ThreeDGF.ThreeDGF\n'
+            'from ThreeDGF import settings\n'
+            'print("matplotlib" in sys.modules, "astropy" in sys.modules, settings._bessel_interpolators is not None)'
+            )
+
+        self.assertEqual(_run(code).stdout.split(), ['False', 'False', 'False'])
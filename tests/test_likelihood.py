@@ -0,0 +1,99 @@
+import unittest
+import numpy as np
+
+from ThreeDGF import likelihood as L
+
+
+class Test_Binned_Chi_Squared(unittest.TestCase):
+
+    def setUp(self):
+
+        np.random.seed(2)
+        self.shape=(50, 7)
+        self.data=np.random.rand(*self.shape)
+        self.noise=0.1+np.random.rand(*self.shape)
+        self.models=np.random.rand(4, *self.shape)
+
+        self.good_pixels=np.ones(self.shape, dtype=bool)
+        self.good_pixels[10:15]=False
+        self.good_pixels[30, 2]=False
+
+    def _naive_chi2(self, model, good):
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sum(((self.data-model)**2/self.noise**2)[good])
+
+    def test_matches_naive_chi2(self):
+
+        chi2=L.BinnedChiSquared(self.data, self.noise, self.good_pixels)
+
+        self.assertTrue(np.allclose(chi2(self.models[0]), self._naive_chi2(self.models[0], self.good_pixels)))
+        self.assertEqual(chi2.n_valid, self.good_pixels.sum())
+
+    def test_batch_matches_single_models(self):
+
+        chi2=L.BinnedChiSquared(self.data, self.noise, self.good_pixels)
+
+        batch=chi2.chi2_batch(self.models)
+        singles=np.array([chi2.chi2(m) for m in self.models])
+
+        self.assertEqual(batch.shape, (4,))
+        self.assertTrue(np.allclose(batch, singles))
+
+    def test_1D_wavelength_mask(self):
+
+        wavelength_mask=np.ones(self.shape[0], dtype=bool)
+        wavelength_mask[20:25]=False
+        chi2=L.BinnedChiSquared(self.data, self.noise, wavelength_mask)
+
+        good=np.outer(wavelength_mask, np.ones(self.shape[1], dtype=bool))
+        self.assertTrue(np.allclose(chi2(self.models[1]), self._naive_chi2(self.models[1], good)))
+
+    def test_bad_noise_is_masked(self):
+
+        self.noise[5, 3]=0.0
+        self.data[6, 1]=np.nan
+        chi2=L.BinnedChiSquared(self.data, self.noise)
+
+        good=np.ones(self.shape, dtype=bool)
+        good[5, 3]=False
+        good[6, 1]=False
+        self.assertTrue(np.isfinite(chi2(self.models[0])))
+        self.assertTrue(np.allclose(chi2(self.models[0]), self._naive_chi2(self.models[0], good)))
+
+    def test_wrong_model_shape_fails(self):
+
+        chi2=L.BinnedChiSquared(self.data, self.noise)
+
+        self.assertRaises(ValueError, chi2, self.models[0].T)
+        self.assertRaises(ValueError, chi2.chi2_batch, self.models[0])
+
+    def test_small_buffer_matches_naive_chi2(self):
+
+        #Forces several blocks of both pixels and models
+        chi2=L.BinnedChiSquared(self.data, self.noise, self.good_pixels, max_buffer_size=100)
+
+        expected=np.array([self._naive_chi2(m, self.good_pixels) for m in self.models])
+        self.assertTrue(np.allclose(chi2.chi2_batch(self.models), expected))
+        self.assertTrue(np.allclose(chi2(self.models[2]), expected[2]))
+
+    def test_work_buffer_is_capped_and_reused(self):
+
+        chi2=L.BinnedChiSquared(self.data, self.noise, max_buffer_size=100)
+
+        chi2(self.models[0])
+        buffer=chi2._work[np.dtype(np.float64)]
+        chi2.chi2_batch(self.models)
+        chi2(self.models[1])
+
+        self.assertIs(chi2._work[np.dtype(np.float64)], buffer)
+        self.assertLessEqual(buffer.size, 100)
+
+    def test_float32_models(self):
+
+        chi2=L.BinnedChiSquared(self.data, self.noise, self.good_pixels)
+        models_32=self.models.astype(np.float32)
+
+        expected=np.array([self._naive_chi2(m, self.good_pixels) for m in models_32.astype(np.float64)])
+        self.assertTrue(np.allclose(chi2.chi2_batch(models_32), expected, rtol=1e-5))
+        self.assertEqual(list(chi2._work.keys()), [np.dtype(np.float32)])
@@ -0,0 +1,92 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+
+from ThreeDGF import mocks as M
+from ThreeDGF import settings
+
+
+class Test_Mock_Cubes(unittest.TestCase):
+
+    def setUp(self):
+
+        self.shape=(20, 24)
+        self.n_lamdas=80
+        self.kwargs={'sn':20.0, 'seeing_FWHM':3.0, 'n_bins':30, 'seed':3}
+
+        #Enough for a few channels per chunk, so the cube is made in lots of chunks
+        self.small_memory=8*8*self.shape[0]*self.shape[1]*20
+
+    def test_bins_cover_every_spaxel(self):
+
+        x, y, bins=M.voronoi_like_bins(self.shape, 30)
+
+        self.assertEqual(len(bins), self.shape[0]*self.shape[1])
+        self.assertTrue(np.array_equal(np.unique(bins), np.arange(bins.max()+1)))
+        self.assertLessEqual(bins.max()+1, 30)
+
+    def test_mock_is_reproducible(self):
+
+        mock_1=M.make_mock_cube(self.shape, self.n_lamdas, **self.kwargs)
+        mock_2=M.make_mock_cube(self.shape, self.n_lamdas, **self.kwargs)
+
+        self.assertTrue(np.array_equal(mock_1['data'], mock_2['data']))
+
+    def test_mock_independent_of_memory_budget(self):
+
+        mock_1=M.make_mock_cube(self.shape, self.n_lamdas, **self.kwargs)
+        mock_2=M.make_mock_cube(self.shape, self.n_lamdas, max_memory=self.small_memory, **self.kwargs)
+
+        self.assertTrue(np.allclose(mock_1['data'], mock_2['data']))
+
+    def test_memory_budget_read_from_settings(self):
+
+        old_budget=settings.max_chunk_memory
+        settings.max_chunk_memory=1000
+        try:
+            self.assertRaises(ValueError, M.make_mock_cube, self.shape, self.n_lamdas, **self.kwargs)
+        finally:
+            settings.max_chunk_memory=old_budget
+
+    def test_noise_independent_of_bins(self):
+
+        mock=M.make_mock_cube(self.shape, self.n_lamdas, keep_cube=True, **self.kwargs)
+
+        #The first channel is pure noise. Its first deviates must not be the ones which placed the bin generators
+        n_bins=self.kwargs['n_bins']
+        rng=np.random.RandomState(self.kwargs['seed'])
+        bin_deviates=rng.standard_normal(n_bins)
+        noise_deviates=mock['cube'][0].ravel()[:n_bins]/mock['noise_per_spaxel']
+
+        self.assertFalse(np.allclose(noise_deviates, bin_deviates, atol=1e-3))
+
+    def test_noise_level(self):
+
+        #Far from the line the cube is pure noise
+        mock=M.make_mock_cube(self.shape, self.n_lamdas, keep_cube=True, **self.kwargs)
+
+        self.assertAlmostEqual(np.std(mock['cube'][:5])/mock['noise_per_spaxel'], 1.0, delta=0.1)
+        self.assertEqual(mock['noise'].shape, mock['data'].shape)
+
+    def test_streamed_cube_matches_in_memory_cube(self):
+
+        mock=M.make_mock_cube(self.shape, self.n_lamdas, keep_cube=True, **self.kwargs)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename=os.path.join(tmpdir, 'mock.npy')
+            M.write_mock_cube(filename, self.shape, self.n_lamdas, max_memory=self.small_memory, **self.kwargs)
+            streamed=np.load(filename, mmap_mode='r')
+
+            self.assertTrue(np.allclose(streamed, mock['cube']))
+            del streamed
+
+    def test_recovery_harness(self):
+
+        results=M.recovery_harness([(16, 16)], n_lamdas=60, sn=50.0, fit_params=('PA', 'v0'))
+
+        self.assertEqual(len(results), 1)
+        recovered=results[0]['recovered']
+        self.assertAlmostEqual(recovered['PA'], 45.0, delta=2.0)
+        self.assertAlmostEqual(recovered['v0'], 20.0, delta=5.0)
+        self.assertGreater(results[0]['time'], 0.0)
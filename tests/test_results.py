@@ -0,0 +1,133 @@
+import unittest
+import tempfile
+import time
+from unittest import mock
+import numpy as np
+
+from ThreeDGF import results as R
+
+
+class Test_Results_Storage(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmpdir=tempfile.TemporaryDirectory()
+        self.directory=self.tmpdir.name
+
+        np.random.seed(1)
+        self.n_steps=23
+        self.chain=np.random.rand(self.n_steps, 6, 3)
+        self.log_prob=np.random.rand(self.n_steps, 6)
+        self.models=np.random.rand(self.n_steps, 20, 4)
+
+    def tearDown(self):
+
+        self.tmpdir.cleanup()
+
+    def _write(self, **kwargs):
+
+        with R.ResultsWriter(self.directory, **kwargs) as writer:
+            for i in range(self.n_steps):
+                writer.append(self.chain[i], self.log_prob[i], self.models[i])
+
+        return writer
+
+    def test_round_trip(self):
+
+        writer=self._write(batch_size=5)
+        reader=R.ResultsReader(self.directory)
+
+        self.assertEqual(writer.n_shards, 5)
+        self.assertEqual(len(reader), self.n_steps)
+        self.assertTrue(np.array_equal(reader.chain, self.chain))
+        self.assertTrue(np.array_equal(reader.log_prob, self.log_prob))
+
+    def test_models_are_thinned(self):
+
+        self._write(batch_size=5, model_thin=3)
+        reader=R.ResultsReader(self.directory)
+
+        self.assertTrue(np.array_equal(reader.models, self.models[::3]))
+
+    def test_no_models_without_thin(self):
+
+        self._write(batch_size=5)
+        reader=R.ResultsReader(self.directory)
+
+        self.assertEqual(len(reader.shards['model']), 0)
+
+    def test_read_range_crosses_shards(self):
+
+        self._write(batch_size=5)
+        reader=R.ResultsReader(self.directory)
+
+        self.assertTrue(np.array_equal(reader.read('chain', 3, 17), self.chain[3:17]))
+        self.assertIsInstance(reader.shards['chain'][0], np.memmap)
+
+    def test_refuses_to_overwrite(self):
+
+        self._write(batch_size=5)
+
+        self.assertRaises(ValueError, R.ResultsWriter, self.directory)
+
+    def test_overhead_fraction(self):
+
+        writer=self._write(batch_size=5)
+
+        self.assertGreater(writer.append_time, 0.0)
+        self.assertTrue(np.allclose(writer.overhead_fraction(sampling_time=4*writer.append_time), 0.25))
+
+    def test_append_does_not_wait_for_slow_writes(self):
+
+        real_save=np.save
+        def slow_save(*args, **kwargs):
+            time.sleep(0.2)
+            real_save(*args, **kwargs)
+
+        with mock.patch('ThreeDGF.results.np.save', side_effect=slow_save):
+            writer=R.ResultsWriter(self.directory, batch_size=2, max_queued_batches=10)
+
+            t0=time.perf_counter()
+            for i in range(10):
+                writer.append(self.chain[i], self.log_prob[i])
+            append_time=time.perf_counter()-t0
+
+            writer.close()
+
+        #5 batches of 2 files each take 2 seconds to write
+        self.assertLess(append_time, 0.5)
+        self.assertTrue(np.array_equal(R.ResultsReader(self.directory).chain, self.chain[:10]))
+
+    def test_write_errors_reach_the_caller(self):
+
+        with mock.patch('ThreeDGF.results.np.save', side_effect=OSError('disk full')):
+            writer=R.ResultsWriter(self.directory, batch_size=2)
+            for i in range(4):
+                writer.append(self.chain[i], self.log_prob[i])
+
+            self.assertRaises(RuntimeError, writer.flush)
+            self.assertRaises(RuntimeError, writer.close)
+
+    def test_write_errors_dont_hide_exceptions_in_with_block(self):
+
+        def run():
+            with R.ResultsWriter(self.directory, batch_size=2) as writer:
+                for i in range(4):
+                    writer.append(self.chain[i], self.log_prob[i])
+                raise KeyError('from the sampler')
+
+        with mock.patch('ThreeDGF.results.np.save', side_effect=OSError('disk full')):
+            self.assertRaises(KeyError, run)
+
+    def test_cant_use_writer_after_close(self):
+
+        writer=R.ResultsWriter(self.directory, batch_size=1, max_queued_batches=2)
+        writer.append(self.chain[0], self.log_prob[0])
+        writer.close()
+
+        self.assertRaises(ValueError, writer.append, self.chain[1], self.log_prob[1])
+        self.assertRaises(ValueError, writer.flush)
+        writer.close()
+
+        self.assertEqual(writer.n_steps, 1)
+        self.assertEqual(len(R.ResultsReader(self.directory)), 1)